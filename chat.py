@@ -3,16 +3,34 @@ import asyncio
 import sys
 import curses
 import signal
+import string
 import collections
 import abc
+import bisect
 import logging
 import enum
+import functools
 import traceback
 
+# DEC private mode 2026: the terminal holds off painting until the end
+# marker, so a frame never shows up half drawn
+_SYNC_BEGIN = '\x1b[?2026h'
+_SYNC_END = '\x1b[?2026l'
+
+_FRAME_INTERVAL = 1/60
+
+def _show_cursor(visible: bool) -> None:
+    # terminals without civis/cnorm (e.g. vt100) can't change the cursor;
+    # leave it as it is there
+    try:
+        curses.curs_set(1 if visible else 0)
+    except curses.error:
+        pass
+
 class InputManager:
-    def __init__(self, window: curses.window, queue: asyncio.Queue | None = None) -> None:
+    def __init__(self, window: curses.window) -> None:
         self._window = window
-        self._input_queue = queue if queue else asyncio.Queue()
+        self._on_input = None
         self._input = collections.deque()
         self._cursor = 0
 
@@ -22,28 +40,57 @@ class InputManager:
 
         loop = asyncio.get_event_loop()
         event = asyncio.Event()
-        loop.add_reader(sys.stdin, event.set)
+        loop.add_reader(sys.stdin.fileno(), event.set)
 
         while True:
             await event.wait()
             event.clear()
 
-            try:
-                c = self._window.get_wch()
-            except curses.error:
-                continue
+            # a paste arrives as one readable event, so take everything
+            # curses has buffered before going back to sleep
+            while True:
+                try:
+                    ch = self._window.get_wch()
+                except curses.error:
+                    break
+
+                if self._on_input:
+                    self._on_input(ch)
 
-            self._input_queue.put_nowait(c)
+    def on_input(self, f):
+        self._on_input = f
 
-    async def get(self):
-        return await self._input_queue.get()
+_SPECIAL_ORDS = frozenset(range(32)) | {127}
+_BACKSPACE = frozenset((curses.KEY_BACKSPACE, 127))
+_CTRL_BACKSPACE = frozenset((23, 263, 8))
+_DELETE = frozenset((curses.KEY_DC,))
+_CTRL_DELETE = frozenset()
+_ENTER = frozenset((curses.KEY_ENTER, 10))
 
 class EditField:
     def __init__(self, max_chars=0) -> None:
-        self._text = collections.deque()
-        self._cursor = 0
+        self._left: list[str] = []
+        self._right: list[str] = []
+        self._text_cache: str | None = ''
         self._max_chars = max_chars
 
+        self._dispatch = {
+            curses.KEY_RIGHT: self._cursor_right,
+            curses.KEY_LEFT: self._cursor_left,
+            curses.KEY_HOME: self._cursor_home,
+            curses.KEY_END: self._cursor_end,
+        }
+        # later groups win on overlap: KEY_BACKSPACE is also a ctrl-backspace
+        # code on some terminals but is treated as a plain backspace
+        for keys, handler in (
+            (_CTRL_DELETE, self._ctrl_delete),
+            (_DELETE, self._delete),
+            (_CTRL_BACKSPACE, self._ctrl_backspace),
+            (_BACKSPACE, self._backspace),
+            (_ENTER, self._enter),
+        ):
+            self._dispatch.update(dict.fromkeys(keys, handler))
+
     def keypress(self, ch):
         if self._isspecial(ch):
             ch = ord(ch)
@@ -51,57 +98,19 @@ class EditField:
         if isinstance(ch, str):
             return self._insert(ch)
 
-        elif self._isbackspace(ch):
-            return self._backspace()
-
-        elif self._isctrlbackspace(ch):
-            while self._cur_char() == ' ':
-                self._backspace()
-            while self._cur_char() not in (' ', None):
-                self._backspace()
-            return 'input', None
-
-        elif self._isdelete(ch):
-            return self._delete()
-
-        elif self._isctrldelete(ch):
-            while self._cur_char() == ' ':
-                self._delete()
-            while self._cur_char() not in (' ', None):
-                self._delete()
-            return 'input', None
-
-        elif ch == curses.KEY_RIGHT:
-            if self._cursor < len(self._text):
-                return self._move_cursor(+1)
-
-        elif ch == curses.KEY_LEFT:
-            if self._cursor > 0:
-                return self._move_cursor(-1)
-
-        elif ch == curses.KEY_HOME:
-            return self._move_cursor(0, relative=False)
-
-        elif ch == curses.KEY_END:
-            return self._move_cursor(len(self._text), relative=False)
-
-        elif self._isenter(ch):
-            return 'flush', self._flush()
-
+        handler = self._dispatch.get(ch)
+        if handler:
+            return handler()
         else:
             return 'special', ch
 
     def _isspecial(self, ch) -> bool:
-        if isinstance(ch, str):
-            code = ord(ch)
-            return code < 32 or code == 127
-        else:
-            return False
+        return isinstance(ch, str) and len(ch) == 1 and ord(ch) in _SPECIAL_ORDS
 
     def _insert(self, ch) -> None:
-        if self._max_chars == 0 or len(self._text) < self._max_chars:
-            self._text.insert(self._cursor, ch)
-            self._move_cursor(+1)
+        if self._max_chars == 0 or len(self) < self._max_chars:
+            self._left.append(ch)
+            self._text_cache = None
             return 'input', None
 
     def _move_cursor(self, new_pos: int, *, relative: bool = True):
@@ -110,56 +119,103 @@ class EditField:
         else:
             new_cursor = new_pos
 
-        if new_cursor >= 0 and new_cursor <= len(self._text):
-            self._cursor = new_cursor
+        if new_cursor >= 0 and new_cursor <= len(self):
+            # _right is stored reversed, so both sides of the gap grow and
+            # shrink at the end of their list
+            while len(self._left) > new_cursor:
+                self._right.append(self._left.pop())
+            while len(self._left) < new_cursor:
+                self._left.append(self._right.pop())
         return 'cursor', None
 
-    def _isbackspace(self, ch) -> bool:
-        return ch in (curses.KEY_BACKSPACE, 127)
+    def _cursor_right(self):
+        if self._right:
+            return self._move_cursor(+1)
 
-    def _isctrlbackspace(self, ch) -> bool:
-        return ch in (23, 263, 8)
+    def _cursor_left(self):
+        if self._left:
+            return self._move_cursor(-1)
 
-    def _isdelete(self, ch) -> bool:
-        return ch == curses.KEY_DC
+    def _cursor_home(self):
+        return self._move_cursor(0, relative=False)
 
-    def _isctrldelete(self, ch) -> bool:
-        return False
+    def _cursor_end(self):
+        return self._move_cursor(len(self), relative=False)
+
+    def _enter(self):
+        return 'flush', self._flush()
+
+    def _ctrl_backspace(self):
+        # drop trailing spaces, then the word before them, in one slice
+        left = ''.join(self._left).rstrip(' ')
+        cut = left.rfind(' ') + 1
+        if cut < len(self._left):
+            del self._left[cut:]
+            self._text_cache = None
+        return 'input', None
 
-    def _isenter(self, ch):
-        return ch in (curses.KEY_ENTER, 10)
+    def _ctrl_delete(self):
+        # _right is reversed, so the text after the cursor is at its end
+        right = ''.join(self._right).rstrip(' ')
+        cut = right.rfind(' ') + 1
+        if cut < len(self._right):
+            del self._right[cut:]
+            self._text_cache = None
+        return 'input', None
 
     def _backspace(self):
-        if self._cursor > 0:
-            self._move_cursor(-1)
-            self._delete()
+        if self._left:
+            self._left.pop()
+            self._text_cache = None
         return 'input', None
 
     def _delete(self):
-        if self._cursor < len(self._text):
-            del self._text[self._cursor]
+        if self._right:
+            self._right.pop()
+            self._text_cache = None
         return 'input', None
 
     def _flush(self):
         text = self.text
-        self._text = collections.deque()
-        self._cursor = 0
+        self._left.clear()
+        self._right.clear()
+        self._text_cache = ''
 
         return text
 
-    def _cur_char(self):
-        if self._cursor > 0:
-            return self._text[self._cursor-1]
-        else:
-            return None
+    def __len__(self):
+        return len(self._left) + len(self._right)
 
     @property
     def text(self):
-        return ''.join(self._text)
+        if self._text_cache is None:
+            self._text_cache = ''.join(self._left) + ''.join(reversed(self._right))
+        return self._text_cache
 
     @property
     def cursor(self):
-        return self._cursor
+        return len(self._left)
+
+def _wrap_text(text: str, width: int, col: int = 0) -> tuple[int, int]:
+    # number of line breaks (newlines and wraps) produced by writing text
+    # starting at column col, and the column the cursor ends up in
+    width = max(width, 1)
+    segs = text.split('\n')
+    if len(segs) == 1:
+        return divmod(col + len(text), width)
+
+    # only the first segment starts mid-line; map keeps the per-segment
+    # division for the rest out of the interpreter loop
+    first, *middle, last = segs
+    breaks = len(segs) - 1 + (col + len(first)) // width
+    breaks += sum(map(width.__rfloordiv__, map(len, middle)))
+    wraps, col = divmod(len(last), width)
+    return breaks + wraps, col
+
+@functools.lru_cache(maxsize=32)
+def _count_lines(text: str, width: int) -> tuple[int, int]:
+    breaks, col = _wrap_text(text, width)
+    return breaks + 1, col
 
 class Widget(abc.ABC):
     def __init__(self, x, y, width, height, name: str) -> None:
@@ -230,13 +286,16 @@ class TextBox(Widget):
 
         self._text = ''
         self._text_lines = 0
+        self._last_col = 0
         self._outer = curses.newwin(1, 1, 0, 0)
-        self._inner = curses.newpad(1, 1)
-        self._inner.scrollok(True)
+        self._inner: curses.window | None = None
         self._scrollbar_size = 3 if scrollbar else 0
 
         self._lines = lines
         self._refresh_text = False
+        self._refresh_frame = False
+        self._written = 0
+        self._pad_dims = (0, 0)
         self._bottom = True
         self._pad_line = 0
 
@@ -245,19 +304,8 @@ class TextBox(Widget):
     def input(self, ch) -> bool:
         return False
 
-    def _count_text_lines(self) -> int:
-        lines, col = 1, 0
-        for c in self._text:
-            if c == '\n':
-                col = 0
-                lines += 1
-            else:
-                col += 1
-
-            if col >= self._pad_width:
-                col = 0
-                lines += 1
-
+    def _count_text_lines(self, text: str) -> int:
+        lines, self._last_col = _count_lines(text, self._pad_width)
         return lines
 
     @property
@@ -266,19 +314,68 @@ class TextBox(Widget):
 
     @text.setter
     def text(self, text) -> None:
+        old = self._text
+        if text.startswith(old):
+            # same as appending the new tail, e.g. typing at the end of an
+            # InputBox; only the tail needs counting
+            breaks, self._last_col = _wrap_text(text[len(old):], self._pad_width, self._last_col)
+            self._text_lines += breaks
+        else:
+            # text that only extends what is already on the pad is written
+            # as a tail on the next refresh instead of redrawing the pad
+            if not text.startswith(old[:self._written]):
+                self._refresh_text = True
+            self._text_lines = self._count_text_lines(text)
         self._text = text
-        self._text_lines = self._count_text_lines()
-        self._refresh_text = True
         self._mark_refresh()
 
+    def append_text(self, text) -> None:
+        breaks, self._last_col = _wrap_text(text, self._pad_width, self._last_col)
+        self._text += text
+        self._text_lines += breaks
+        if self._text_lines >= 2*self._lines:
+            self._trim_text()
+        self._mark_refresh()
+
+    def _trim_text(self) -> None:
+        # the pad only keeps the last self._lines rows, so whole lines before
+        # those can be dropped; walk lines from the end, counting their
+        # wrapped rows, until a pad's worth is kept
+        text = self._text
+        width = max(self._pad_width, 1)
+        rows = 0
+        end = len(text)
+        while True:
+            cut = text.rfind('\n', 0, end) + 1
+            rows += 1 + (end - cut) // width
+            if cut == 0:
+                return
+            if rows >= self._lines:
+                break
+            end = cut - 1
+
+        # the last line is untouched, so _last_col still holds
+        self._text = text[cut:]
+        self._text_lines = rows
+        if self._written >= cut:
+            self._written -= cut
+        else:
+            self._refresh_text = True
+
     def refresh(self) -> None:
-        self._outer.erase()
-        self._outer.box()
-        self._outer.noutrefresh()
+        if self._refresh_frame:
+            self._outer.erase()
+            self._outer.box()
+            self._outer.noutrefresh()
+            self._refresh_frame = False
 
         if self._refresh_text:
             self._inner.erase()
             self._inner.addstr(self._text)
+            self._refresh_text = False
+        elif self._written < len(self._text):
+            self._inner.addstr(self._text[self._written:])
+        self._written = len(self._text)
 
         if self._bottom:
             pad_row = max(0, self._text_lines-self._pad_height)
@@ -293,14 +390,28 @@ class TextBox(Widget):
 
         self._pad_width = self.width-self._scrollbar_size-2
         self._pad_height = self.height-2
-        self.text = self.text
+        self._refresh_frame = True
+
+        # only the pad width affects wrapping; a height-only change keeps
+        # the pad and its line count as they are
+        pad_dims = (self._lines, self._pad_width)
+        if pad_dims != self._pad_dims:
+            self._refresh_text = True
+            self._text_lines = self._count_text_lines(self._text)
 
         try:
             self._outer.mvwin(self.y, self.x)
         except curses.error:
             raise Exception(f'{self.y=} {self.x=}')
         self._outer.resize(self.height, self.width)
-        self._inner.resize(self._lines, self._pad_width)
+        if pad_dims != self._pad_dims:
+            # the pad is created at its real size on the first call
+            if self._inner is None:
+                self._inner = curses.newpad(*pad_dims)
+                self._inner.scrollok(True)
+            else:
+                self._inner.resize(*pad_dims)
+            self._pad_dims = pad_dims
 
 class InputBox(TextBox):
     __counter = 0
@@ -324,11 +435,16 @@ class InputBox(TextBox):
             return True
 
         if ev == 'input':
-            self.text = self._edit.text
+            # the edit field hands back the same string object until it
+            # actually changes, e.g. backspace at the start of the line
+            text = self._edit.text
+            if text is not self.text:
+                self.text = text
             return True
 
     def focus(self):
         self._outer.move(1, self._edit.cursor + 1)
+        self._outer.noutrefresh()
 
     def flush(self, f):
         self._on_flush = f
@@ -337,15 +453,20 @@ class App:
     def __init__(self) -> None:
         self._inp_win = curses.newwin(1, 1, 0, 0)
         self._input_manager = InputManager(self._inp_win)
+        self._input_manager.on_input(self._feed_input)
         self._widgets: dict[str, tuple[int, Widget]] = {}
+        self._ordered_widgets: list[tuple[int, int, Widget]] = []
         self._focused_input: str | None = None
         self._unhandled = asyncio.Queue()
         self._refresh_ev = asyncio.Event()
         self._refresh_ev.set()
+        self._dirty_widgets: set[Widget] = set()
+        self._last_refresh = 0.0
         self._on_resize = None
 
     def unfocus_input(self):
         self._focused_input = None
+        _show_cursor(False)
 
     def focus_input(self, widget: str | Widget):
         if isinstance(widget, Widget):
@@ -353,15 +474,20 @@ class App:
 
         if widget in self._widgets:
             self._focused_input = widget
+            _show_cursor(True)
         else:
             raise ValueError(f'Invalid widget {widget}')
 
     def add_widget(self, widget: Widget, *, z: int):
         def refresh():
+            self._dirty_widgets.add(widget)
             self._refresh_ev.set()
 
         widget._set_refresh_marker(refresh)
         self._widgets[widget.name] = z, widget
+        # id breaks z ties so Widgets themselves are never compared
+        bisect.insort(self._ordered_widgets, (z, id(widget), widget))
+        refresh()
 
     def _add_unhandled_input(self, ch):
         self._unhandled.put_nowait(ch)
@@ -369,50 +495,85 @@ class App:
     def _get_widget(self, widget: str) -> Widget:
         return self._widgets[widget][1]
 
-    async def _feed_input(self):
-        while True:
-            ch = await self._input_manager.get()
-
-            if self._focused_input:
-                unhandled = self._get_widget(self._focused_input).input(ch)
-                if unhandled:
-                    self._add_unhandled_input(ch)
+    def _feed_input(self, ch):
+        if self._focused_input:
+            unhandled = self._get_widget(self._focused_input).input(ch)
+            if unhandled:
+                self._add_unhandled_input(ch)
 
     async def _refresher(self):
+        loop = asyncio.get_event_loop()
         while True:
             await self._refresh_ev.wait()
+
+            # hold bursts of input back to one frame per interval; anything
+            # marked dirty while sleeping is drawn by this same refresh
+            elapsed = loop.time() - self._last_refresh
+            if elapsed < _FRAME_INTERVAL:
+                await asyncio.sleep(_FRAME_INTERVAL - elapsed)
+            else:
+                # even off the throttle, let callbacks already scheduled in
+                # this loop iteration mark their widgets first
+                await asyncio.sleep(0)
+
             self._refresh_ev.clear()
             self._refresh()
+            self._last_refresh = loop.time()
 
     def _refresh(self):
-        widgets = self._widgets.values()
-        ordered_widgets = sorted(widgets, key=lambda k: k[0])
-        for z, widget in ordered_widgets:
-            widget.refresh()
-
-        curses.doupdate()
+        # widgets only stage their changes with noutrefresh; nothing reaches
+        # the terminal until doupdate
+        for _, _, widget in self._ordered_widgets:
+            if widget in self._dirty_widgets:
+                widget.refresh()
+        self._dirty_widgets.clear()
+
+        # focus last so its window's cursor is the one doupdate leaves on
+        # screen, even when the focused widget itself wasn't redrawn
         if self._focused_input:
             self._get_widget(self._focused_input).focus()
 
+        # curses keeps its own output buffer, so the begin marker has to be
+        # flushed ahead of doupdate for the frame to land inside it
+        sys.stdout.write(_SYNC_BEGIN)
+        sys.stdout.flush()
+        curses.doupdate()
+        sys.stdout.write(_SYNC_END)
+        sys.stdout.flush()
+
     async def run(self):
         loop = asyncio.get_event_loop()
+        _show_cursor(self._focused_input is not None)
 
-        def sig_resize(*args):
-            def loop_resize():
-                size = os.get_terminal_size()
-                lines, cols = size.lines, size.columns
-                curses.resizeterm(lines, cols)
+        resize_handle = None
+
+        def loop_resize():
+            nonlocal resize_handle
+            resize_handle = None
+
+            size = os.get_terminal_size()
+            lines, cols = size.lines, size.columns
+            curses.resizeterm(lines, cols)
 
-                if self._on_resize:
-                    self._on_resize(lines, cols)
-            loop.call_soon_threadsafe(loop_resize)
+            if self._on_resize:
+                self._on_resize(lines, cols)
+
+        def schedule_resize():
+            nonlocal resize_handle
+            # dragging a window edge sends a stream of SIGWINCH; resize once
+            # the size has held still for a frame
+            if resize_handle:
+                resize_handle.cancel()
+            resize_handle = loop.call_later(_FRAME_INTERVAL, loop_resize)
+
+        def sig_resize(*args):
+            loop.call_soon_threadsafe(schedule_resize)
 
         signal.signal(signal.SIGWINCH, sig_resize)
 
         coros = [
             self._input_manager.manage_input(),
             self._refresher(),
-            self._feed_input(),
         ]
 
         tasks = [asyncio.create_task(coro) for coro in coros]
@@ -423,71 +584,54 @@ class App:
         self._on_resize = f
 
 def _split_irc_command(command: bytes):
-        if command[-2:] != b'\r\n' or len(command) < 3 or len(command) > 512:
-            return False
-
-        command = command[:-2]
-
-        prefix = None
-        idx = -1
-        parts = []
-        if command[0] == ord(':'):
-            prefixend = command.find(b' ')
-            prefix = command[1:prefixend].decode()
-            idx = prefixend
-
-        parts = []
-        while idx < len(command)-1:
-            if len(parts) == 15:
-                return False
-
-            if command[idx+1] == ord(':'):
-                trailing = command[idx+2:]
-                parts.append(trailing)
-                idx = len(command)
-                break
-            else:
-                next = command.find(b' ', idx+1)
-                if next - idx == 1:
-                    return False
-
-                if next != -1:
-                    part = command[idx+1:next]
-                else:
-                    part = command[idx+1:]
+    if not command.endswith(b'\r\n') or not 3 <= len(command) <= 512:
+        return False
 
-                parts.append(part)
+    body = command[:-2]
 
-                idx = next
+    prefix = None
+    if body.startswith(b':'):
+        prefix, _, body = body.partition(b' ')
+        prefix = prefix[1:].decode()
 
-            if idx == -1:
-                break
+    # a trailing parameter always starts a part, so its ' :' can't appear
+    # inside an earlier one
+    head, sep, trailing = body.partition(b' :')
+    if not sep and head.endswith(b' '):
+        head = head[:-1]
 
-        if not parts:
-            return False
+    parts = head.split(b' ')
+    if b'' in parts:
+        return False
 
-        parts = [p.decode() for p in parts]
-        cmd = parts[0]
+    if sep:
+        parts.append(trailing)
+    if len(parts) > 15:
+        return False
 
-        return prefix, cmd, parts[1:]
+    # parameters stay bytes; callers decode only the ones they use
+    return prefix, parts[0], parts[1:]
 
-def _make_irc_command(cmd: str, *args: str, prefix=None):
-    command = bytearray()
+def _make_irc_command(cmd: str, *args: str, prefix: str | bytes | None = None):
+    parts = []
     if prefix:
-        command.extend(b':')
-        command.extend(prefix.encode())
-        command.extend(b' ')
+        parts += (b':', prefix.encode() if isinstance(prefix, str) else prefix, b' ')
 
-    command.extend(cmd.encode())
+    parts.append(cmd.encode())
+    last = len(args)-1
     for i, arg in enumerate(args):
         if arg:
-            command.extend(b' ')
-            if i == len(args)-1 and ' ' in arg:
-                command.extend(b':')
-            command.extend(arg.encode())
+            parts.append(b' :' if i == last and ' ' in arg else b' ')
+            parts.append(arg.encode())
+
+    parts.append(b'\r\n')
+    return b''.join(parts)
+
+# RFC 2812 treats {}|^ as the lowercase forms of []\~ in nicknames
+_IRC_LOWER = str.maketrans(string.ascii_uppercase + '[]\\~', string.ascii_lowercase + '{}|^')
 
-    command.extend(b'\r\n')
-    return bytes(command)
+def _nick_key(nick: str) -> str:
+    return nick.translate(_IRC_LOWER)
 
 class Reply(enum.Enum):
     WELCOME = '001', 'oi oi!'
@@ -499,6 +643,22 @@ class Reply(enum.Enum):
     NOTOPIC = 331, 'Sem tópico'
     NAMREPLY = 353, ''
     ENDOFNAMES = 366, 'Fim da lista de NAMES'
+    NICKNAMEINUSE = 433, 'Nick já em uso'
+
+    def __init__(self, code, msg) -> None:
+        # encoded once here so replies don't re-encode them on every send;
+        # the message is always the last parameter, as in IRCUser.reply
+        self.code_bytes = str(code).encode()
+        if not msg:
+            self.msg_bytes = b''
+        elif ' ' in msg:
+            self.msg_bytes = b' :' + msg.encode()
+        else:
+            self.msg_bytes = b' ' + msg.encode()
+
+@functools.lru_cache(maxsize=None)
+def _make_static_reply(reply: Reply, prefix: bytes) -> bytes:
+    return b''.join((prefix, reply.code_bytes, reply.msg_bytes, b'\r\n'))
 
 class IRCUser:
     def __init__(self, server: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
@@ -511,6 +671,8 @@ class IRCUser:
         self._writer = writer
         self._address = reader._transport.get_extra_info('peername')[0]
         self._server = '127.0.0.1'
+        self._server_prefix_bytes = f':{self._server} '.encode()
+        self._prefix_bytes: bytes | None = None
 
     @property
     def registered(self):
@@ -536,17 +698,24 @@ class IRCUser:
         data = await self._reader.readuntil(b'\r\n')
         return data
 
-    async def send(self, command):
+    def write(self, command):
         if debug:
             print(command)
         self._writer.write(command)
 
+    async def send(self, command):
+        self.write(command)
+
     async def reply(self, reply: Reply, *args, prefix='server'):
+        if not args and prefix == 'server':
+            await self.send(_make_static_reply(reply, self._server_prefix_bytes))
+            return
+
         t = reply.value
         if prefix == 'server':
             prefix = self._server
         elif prefix == 'user':
-            prefix = self.prefix
+            prefix = self.prefix_bytes
         else:
             prefix = None
         command = _make_irc_command(str(t[0]), *args, t[1], prefix=prefix)
@@ -556,36 +725,62 @@ class IRCUser:
     def prefix(self):
         return f'{self.nick}!{self.username}@{self._address}'
 
+    @property
+    def prefix_bytes(self):
+        # reset to None whenever the nick or username changes
+        if self._prefix_bytes is None:
+            self._prefix_bytes = self.prefix.encode()
+        return self._prefix_bytes
+
 class IRCChannel:
     def __init__(self) -> None:
         self._users: set[IRCUser] = set()
+        self._visible_users = 0
         self._topic: str = ''
 
     @property
     def n_of_users(self):
-        n = 0
-        for u in self._users:
-            if u.visible:
-                n += 1
-        return n
+        return self._visible_users
+
+    def add_user(self, user: IRCUser):
+        if user not in self._users:
+            self._users.add(user)
+            if user.visible:
+                self._visible_users += 1
+
+    def remove_user(self, user: IRCUser):
+        if user in self._users:
+            self._users.remove(user)
+            if user.visible:
+                self._visible_users -= 1
 
     @property
     def topic(self):
         return self._topic
 
     async def broadcast(self, command, exclude=None):
-        tasks = [asyncio.create_task(u.send(command)) for u in self._users if u is not exclude]
-        if tasks:
-            await asyncio.wait(tasks, timeout=1)
+        # writes only go into each transport's buffer, so there is nothing
+        # to wait on per user
+        for u in self._users:
+            if u is not exclude:
+                u.write(command)
 
 class IRCServer:
     def __init__(self, port=6665, password: str | None=None) -> None:
         self._channels: dict[str, IRCChannel] = {}
         self._nicks: dict[str, IRCUser] = {}
-        self._users: dict[str, IRCUser] = {}
         self._events = asyncio.Queue()
         self._port = port
         self._password = password
+        self._dispatch = {
+            b'NICK': self._cmd_nick,
+            b'USER': self._cmd_user,
+            b'QUIT': self._cmd_quit,
+            b'JOIN': self._cmd_join,
+            b'PART': self._cmd_part,
+            b'LIST': self._cmd_list,
+            b'PRIVMSG': self._cmd_privmsg,
+        }
 
     async def _handle_user(self, user: IRCUser):
         while True:
@@ -599,74 +794,97 @@ class IRCServer:
                 continue
 
             prefix, cmd, parts = sp
-            cmd = cmd.upper()
+            handler = self._dispatch.get(cmd.upper())
 
-            if prefix:
+            if prefix or not handler:
+                continue
+
+            try:
+                parts = [p.decode() for p in parts]
+            except UnicodeDecodeError:
                 continue
 
-            if cmd == 'NICK':
-                if user.nick in self._nicks:
-                    del self._nicks[user.nick]
-                user._nick = parts[0]
-                self._nicks[user.nick] = user
-
-            elif cmd == 'USER':
-                if user.registered:
-                    await user.reply(Reply.ALREADYREGISTRED)
-                elif len(parts) < 4:
-                    await user.reply(Reply.NEEDMOREPARAMS, 'USER')
-                else:
-                    user._username = parts[0]
-                    try:
-                        user._mode = int(parts[1])
-                    except ValueError: pass
-
-                    user._realname = parts[3]
-                    user._registered = True
-
-                    self._users[user.username] = user.username
-                    await user.reply(Reply.WELCOME, user.username)
-
-            elif cmd == 'QUIT':
-                msg = '' if not parts else parts[0]
-                await self._quit(user, msg)
-
-            elif cmd == 'JOIN':
-                if not parts:
-                    await user.reply(Reply.NEEDMOREPARAMS, 'JOIN')
-                elif parts[0] == '0':
-                    for channel in self._channels:
-                        await self._part(user, channel)
-                else:
-                    for channel in parts[0].split(','):
-                        await self._join(user, channel)
-            elif cmd == 'PART':
-                if not parts:
-                    await user.reply(Reply.NEEDMOREPARAMS, 'PART')
-                else:
-                    for channel in parts[0].split(','):
-                        await self._part(user, channel)
-
-            elif cmd == 'LIST':
-                channels = parts[0].split(',') if parts else self._channels.keys()
-                for chname in channels:
-                    if chname in self._channels:
-                        channel = self._channels[chname]
-                        await user.reply(Reply.LIST, chname, f'{channel.n_of_users}', channel.topic)
-
-                await user.reply(Reply.LISTEND)
-
-            elif cmd == 'PRIVMSG':
-                if len(parts) < 2:
-                    await user.reply(Reply.NEEDMOREPARAMS, 'PRIVMSG')
-                else:
-                    await self._privmsg(user, parts[0], parts[1])
+            await handler(user, parts)
+
+    async def _cmd_nick(self, user: IRCUser, parts: list[str]):
+        key = _nick_key(parts[0])
+        if self._nicks.get(key, user) is not user:
+            await user.reply(Reply.NICKNAMEINUSE, parts[0])
+            return
+
+        if user.nick and self._nicks.get(_nick_key(user.nick)) is user:
+            del self._nicks[_nick_key(user.nick)]
+        user._nick = parts[0]
+        user._prefix_bytes = None
+        self._nicks[key] = user
+
+    async def _cmd_user(self, user: IRCUser, parts: list[str]):
+        if user.registered:
+            await user.reply(Reply.ALREADYREGISTRED)
+        elif len(parts) < 4:
+            await user.reply(Reply.NEEDMOREPARAMS, 'USER')
+        else:
+            user._username = parts[0]
+            user._prefix_bytes = None
+            try:
+                user._mode = int(parts[1])
+            except ValueError: pass
+
+            user._realname = parts[3]
+            user._registered = True
+
+            await user.reply(Reply.WELCOME, user.username)
+
+    async def _cmd_quit(self, user: IRCUser, parts: list[str]):
+        msg = '' if not parts else parts[0]
+        await self._quit(user, msg)
+
+    async def _cmd_join(self, user: IRCUser, parts: list[str]):
+        if not parts:
+            await user.reply(Reply.NEEDMOREPARAMS, 'JOIN')
+        elif parts[0] == '0':
+            for channel in self._channels:
+                await self._part(user, channel)
+        else:
+            for channel in parts[0].split(','):
+                await self._join(user, channel)
+
+    async def _cmd_part(self, user: IRCUser, parts: list[str]):
+        if not parts:
+            await user.reply(Reply.NEEDMOREPARAMS, 'PART')
+        else:
+            for channel in parts[0].split(','):
+                await self._part(user, channel)
+
+    async def _cmd_list(self, user: IRCUser, parts: list[str]):
+        channels = parts[0].split(',') if parts else self._channels.keys()
+        for chname in channels:
+            if chname in self._channels:
+                channel = self._channels[chname]
+                await user.reply(Reply.LIST, chname, f'{channel.n_of_users}', channel.topic)
+
+        await user.reply(Reply.LISTEND)
+
+    async def _cmd_privmsg(self, user: IRCUser, parts: list[str]):
+        if len(parts) < 2:
+            await user.reply(Reply.NEEDMOREPARAMS, 'PRIVMSG')
+        else:
+            await self._privmsg(user, parts[0], parts[1])
 
     async def handle_user(self, user: IRCUser):
         try:
             await self._handle_user(user)
         except:
             traceback.print_exc()
+        finally:
+            self._release_user(user)
+
+    def _release_user(self, user: IRCUser):
+        # the connection is gone; free its nick and channel memberships
+        if user.nick and self._nicks.get(_nick_key(user.nick)) is user:
+            del self._nicks[_nick_key(user.nick)]
+        for channel in self._channels.values():
+            channel.remove_user(user)
 
     async def run(self):
         def connect(reader, writer):
@@ -681,24 +899,25 @@ class IRCServer:
             self._channels[chname] = IRCChannel()
 
         channel = self._channels[chname]
-        channel._users.add(user)
+        channel.add_user(user)
 
-        await channel.broadcast(_make_irc_command('JOIN', chname, prefix=user.prefix))
+        await channel.broadcast(_make_irc_command('JOIN', chname, prefix=user.prefix_bytes))
         await user.reply(Reply.NOTOPIC, chname)
         await user.reply(Reply.NAMREPLY)
 
     async def _privmsg(self, user: IRCUser, chname: str, text: str):
-        cmd = _make_irc_command('PRIVMSG', chname, text, prefix=user.prefix)
+        cmd = _make_irc_command('PRIVMSG', chname, text, prefix=user.prefix_bytes)
         if chname[0] in '#&+':
             if chname not in self._channels:
                 await user.reply(Reply.NOSUCHNICK, chname)
             else:
                 await self._channels[chname].broadcast(cmd, exclude=user)
         else:
-            if chname not in self._users:
+            target = self._nicks.get(_nick_key(chname))
+            if not target:
                 await user.reply(Reply.NOSUCHNICK, chname)
             else:
-                await self._users[chname].send(cmd)
+                await target.send(cmd)
 
 class IRCClient:
     def __init__(self, channel='#t') -> None:
@@ -731,11 +950,11 @@ class IRCClient:
             p = await self._user.recv()
             prefix, cmd, args = _split_irc_command(p)
             nick = prefix.split('!')[0]
-            if cmd == 'PRIVMSG':
-                self._post_message(f'<{nick}> {args[1]}\n')
-            if cmd == 'JOIN':
+            if cmd == b'PRIVMSG':
+                self._post_message(f'<{nick}> {args[1].decode()}\n')
+            if cmd == b'JOIN':
                 self._post_message(f'*{nick} entrou no chat*\n')
-            if cmd == 'PART':
+            if cmd == b'PART':
                 self._post_message(f'*{nick} saiu do chat*\n')
 
     def enqueue_msg(self, msg):
@@ -786,12 +1005,12 @@ async def main(stdscr: curses.window):
                 client._nick = nick
                 client._login_ev.set()
             else:
-                textbox.text += f'<{nick}> {line}\n'
+                textbox.append_text(f'<{nick}> {line}\n')
                 client.enqueue_msg(line)
 
     @client.on_message
     def on_msg(msg):
-        textbox.text += msg
+        textbox.append_text(msg)
 
     @app.resize
     def resize(lines, cols):
@@ -815,8 +1034,11 @@ async def serve_main():
     server = IRCServer()
     await server.run()
 
-if __name__ == '__main__':
+def _main():
     if len(sys.argv) > 1 and sys.argv[1] == 'serve':
         asyncio.run(serve_main())
     else:
         curses.wrapper(sync_main)
+
+if __name__ == '__main__':
+    _main()